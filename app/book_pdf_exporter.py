@@ -1,58 +1,32 @@
 # app/book_pdf_exporter.py
 from weasyprint import HTML, CSS
-from jinja2 import Template
+from weasyprint.text.fonts import FontConfiguration
+import jinja2
+import io
 import os
 from datetime import datetime
 import pathlib
 
-def save_book_as_pdf(title: str, book_data: dict, filename: str) -> str:
-    """
-    Generates the final, professionally formatted PDF with all structure requirements met.
-    """
-    output_dir = "generated_books"
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, filename)
-
-    # --- Prepare all data for the template ---
-    all_sections_for_toc = []
-    has_prologue = bool(book_data.get('prologue_text'))
-    has_epilogue = bool(book_data.get('epilogue_text'))
-    # Use preface_text directly in template context
-    
-    # Correctly build the TOC including a check for the preface
-    if book_data.get('preface_text'):
-        all_sections_for_toc.append({"title": "Preface", "href": "#preface"})
-    if has_prologue:
-        all_sections_for_toc.append({"title": "Prologue", "href": "#prologue"})
-    for i, ch in enumerate(book_data.get("chapters", [])):
-        all_sections_for_toc.append({"title": ch["heading"], "href": f"#chapter-{i+1}"})
-    if has_epilogue:
-        all_sections_for_toc.append({"title": "Epilogue", "href": "#epilogue"})
-
-    template_context = {
-        "book_title": title,
-        "print_date": datetime.now().strftime("%B %d, %Y"),
-        "toc_entries": all_sections_for_toc,
-        "has_prologue": has_prologue,
-        "has_epilogue": has_epilogue,
-        **book_data
-    }
-    
-    # --- FINAL, CORRECTED HTML TEMPLATE ---
-    html_template = Template("""
+# --- FINAL, CORRECTED HTML TEMPLATE ---
+# Split into three precompiled partials (front matter, one chapter, end
+# matter) so each export only walks the dynamic parts it needs; the
+# rendered pieces are joined into the final document.
+_FRONT_TEMPLATE_SRC = """
     <!DOCTYPE html>
     <html>
     <head><meta charset="UTF-8"><title>{{ book_title }}</title></head>
     <body>
+        {% if debug %}
         <div class="page swapi-call-page debug-page"><h1>SWAPI API</h1><pre>{{ swapi_call_text }}</pre></div>
         <div class="page swapi-json-page debug-page"><pre>{{ swapi_json_output }}</pre></div>
-        
+        {% endif %}
+
         <!-- FIX #1: Correctly structured four blank pages -->
         <div class="page blank-page"></div>
         <div class="page blank-page"></div>
         <div class="page blank-page"></div>
         <div class="page blank-page"></div>
-        
+
         {% if image_path %}
         <div class="page image-page">
             <div class="image-container">
@@ -60,7 +34,7 @@ def save_book_as_pdf(title: str, book_data: dict, filename: str) -> str:
             </div>
         </div>
         {% endif %}
-        
+
         <!-- FIX #2: Title page without the date -->
         <div class="page title-page">
             <div class="title-main-block">
@@ -70,14 +44,14 @@ def save_book_as_pdf(title: str, book_data: dict, filename: str) -> str:
                 <h2 class="subtitle">A STAR WARS FAN NOVEL</h2>
             </div>
         </div>
-        
+
         <!-- FIX #2: New, separate page for the print date -->
         <div class="page print-date-page">
             <p>A personalized edition created on<br>{{ print_date }}</p>
         </div>
 
         <div class="page blank-page"></div><div class="page blank-page"></div>
-        
+
         <div class="page toc-page">
             <h1>Table of Contents</h1>
             <div class="toc-list">
@@ -92,78 +66,95 @@ def save_book_as_pdf(title: str, book_data: dict, filename: str) -> str:
         </div>
 
         <div class="page blank-page"></div>
-        
+
         <!-- FIX #3: Added the Preface block -->
         {% if preface_text %}
         <div class="page content-page" id="preface">
             <h2>Preface</h2>
-            <div class="content-block">{% for p in preface_text.split('\\n\\n') %}<p>{{ p }}</p>{% endfor %}</div>
+            <div class="content-block">{% for p in preface_paragraphs %}<p>{{ p }}</p>{% endfor %}</div>
         </div>
         <div class="page blank-page"></div>
         {% endif %}
-        
+
         {% if has_prologue %}
         <div class="page content-page" id="prologue">
             <h2>Prologue</h2>
-            <div class="content-block">{% for p in prologue_text.split('\\n\\n') %}<p>{{ p }}</p>{% endfor %}</div>
+            <div class="content-block">{% for p in prologue_paragraphs %}<p>{{ p }}</p>{% endfor %}</div>
         </div>
         <div class="page blank-page"></div>
         {% endif %}
+    """
 
-        {% for chapter in chapters %}
+_CHAPTER_TEMPLATE_SRC = """
         <div class="page chapter-title-page">
             <div class="chapter-title-content">
-                <span class="chapter-number">Chapter {{ loop.index }}</span>
+                <span class="chapter-number">Chapter {{ index }}</span>
                 <h2>{{ chapter.heading }}</h2>
             </div>
         </div>
 
-        {% if chapter.image_path %}
+        {% if chapter.has_image %}
         <div class="page image-page">
             <div class="image-container">
-                <img src="{{ chapter.image_path }}" alt="Image for Chapter {{ loop.index }}">
+                <img src="{{ chapter.image_path }}" alt="Image for Chapter {{ index }}">
             </div>
         </div>
         {% endif %} <!-- <<< ADD THIS LINE -->
 
-        <div class="page content-page" id="chapter-{{ loop.index }}">
+        <div class="page content-page" id="chapter-{{ index }}">
             <div class="content-block">
-            {% for p in chapter.content.split('\\n\\n') %}<p>{{ p }}</p>{% endfor %}
+            {% for p in chapter.paragraphs %}<p>{{ p }}</p>{% endfor %}
             </div>
         </div>
-        {% endfor %} 
-        
+    """
+
+_END_TEMPLATE_SRC = """
         {% if has_epilogue %}
         <div class="page blank-page"></div>
         <div class="page content-page" id="epilogue">
             <h2>Epilogue</h2>
-            <div class="content-block">{% for p in epilogue_text.split('\\n\\n') %}<p>{{ p }}</p>{% endfor %}</div>
+            <div class="content-block">{% for p in epilogue_paragraphs %}<p>{{ p }}</p>{% endfor %}</div>
         </div>
         {% endif %}
     </body>
     </html>
-    """)
-    rendered_html = html_template.render(template_context)
-
-    # --- CSS Styling with Restored Print Date Page Style ---
-    fonts_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'fonts'))
-    baskerville_regular_uri = pathlib.Path(os.path.abspath(os.path.join(fonts_dir, 'LibreBaskerville-Regular.ttf'))).as_uri()
-    baskerville_italic_uri = pathlib.Path(os.path.abspath(os.path.join(fonts_dir, 'LibreBaskerville-Italic.ttf'))).as_uri()
-    baskerville_bold_uri = pathlib.Path(os.path.abspath(os.path.join(fonts_dir, 'LibreBaskerville-Bold.ttf'))).as_uri()
-
-    font_config = f"""
-    @font-face  {{ font-family: 'Baskerville'; src: url('{baskerville_regular_uri}'); }}
-    @font-face {{ font-family: 'Baskerville'; font-style: italic; src: url('{baskerville_italic_uri}'); }}
-    @font-face {{ font-family: 'Baskerville'; font-weight: bold; src: url('{baskerville_bold_uri}'); }}
     """
-    
-    main_css = """
+
+_BOOK_ENV = jinja2.Environment(
+    loader=jinja2.DictLoader({
+        "front": _FRONT_TEMPLATE_SRC,
+        "chapter": _CHAPTER_TEMPLATE_SRC,
+        "end": _END_TEMPLATE_SRC,
+    }),
+    autoescape=True,
+    cache_size=400,
+    auto_reload=False,
+)
+_FRONT_TEMPLATE = _BOOK_ENV.get_template("front")
+_CHAPTER_TEMPLATE = _BOOK_ENV.get_template("chapter")
+_END_TEMPLATE = _BOOK_ENV.get_template("end")
+
+# --- CSS Styling with Restored Print Date Page Style ---
+# The font URIs and stylesheet never change between exports, so resolve
+# and parse them once at import time too.
+_FONTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'fonts'))
+_BASKERVILLE_REGULAR_URI = pathlib.Path(os.path.join(_FONTS_DIR, 'LibreBaskerville-Regular.ttf')).as_uri()
+_BASKERVILLE_ITALIC_URI = pathlib.Path(os.path.join(_FONTS_DIR, 'LibreBaskerville-Italic.ttf')).as_uri()
+_BASKERVILLE_BOLD_URI = pathlib.Path(os.path.join(_FONTS_DIR, 'LibreBaskerville-Bold.ttf')).as_uri()
+
+_FONT_FACE_CSS = f"""
+    @font-face  {{ font-family: 'Baskerville'; src: url('{_BASKERVILLE_REGULAR_URI}'); }}
+    @font-face {{ font-family: 'Baskerville'; font-style: italic; src: url('{_BASKERVILLE_ITALIC_URI}'); }}
+    @font-face {{ font-family: 'Baskerville'; font-weight: bold; src: url('{_BASKERVILLE_BOLD_URI}'); }}
+    """
+
+_MAIN_CSS = """
     @page { size: 140mm 216mm; margin: 25mm; }
     @page:blank { @bottom-center { content: ""; } }
     @page main { @bottom-center { content: counter(page); font-family: 'Baskerville', serif; font-size: 9pt; } }
     @page image-page-style { margin: 0; }
 
-    body { font-family: 'Baskerville', serif; font-size: 11pt; line-height: 1.6; -webkit-font-smoothing: antialiased; }
+    body { font-family: 'Baskerville', serif; font-size: 11pt; line-height: 1.6; }
 
     .page { page-break-after: always; position: relative; height: 100%; }
     body > div:last-of-type { page-break-after: auto; }
@@ -193,7 +184,7 @@ def save_book_as_pdf(title: str, book_data: dict, filename: str) -> str:
     .book-title { font-size: 38pt; font-weight: bold; margin: 0.5em 0; line-height: 1.2; }
     .subtitle { font-size: 14pt; margin: 1em 0; letter-spacing: 0.2em; text-transform: uppercase; }
     .title-decoration { font-size: 24pt; margin: 1em 0; color: #555; }
-    
+
    .print-date-page {
         display: flex;
         flex-direction: column;
@@ -210,14 +201,6 @@ def save_book_as_pdf(title: str, book_data: dict, filename: str) -> str:
         font-size: 10pt;
         margin-bottom: 20pt; /* Push it a bit above the bottom */
         }
-    .toc-page { padding: 2em 0; page-break-inside: avoid; page: main; }
-    .toc-page h1 { font-size: 32pt; margin-bottom: 1.2em; letter-spacing: 0.1em; }
-    .toc-list { width: 85%; margin: 0 auto; }
-    .toc-entry { display: flex; align-items: baseline; margin-bottom: 1.2em; font-size: 12pt; }
-    .toc-entry .leader { flex-grow: 1; border-bottom: 1px dotted rgba(0,0,0,0.5); margin: 0 0.5em; position: relative; top: -0.2em; }
-    .toc-entry a { display: none; }
-
-    /* ...and replace it with this corrected version. */
     .toc-page { padding: 2em 0; page-break-inside: avoid; }
     .toc-page h1 { font-size: 32pt; margin-bottom: 1.0em; letter-spacing: 0.1em; } /* Tighter margin */
     .toc-list { width: 85%; margin: 0 auto; }
@@ -225,7 +208,7 @@ def save_book_as_pdf(title: str, book_data: dict, filename: str) -> str:
     .toc-entry .leader { flex-grow: 1; border-bottom: 1px dotted rgba(0,0,0,0.5); margin: 0 0.5em; position: relative; top: -0.2em; }
     .entry-title { flex-shrink: 0; padding-right: 0.5em; }
     .toc-entry a { display: none; }
-    
+
 
     .chapter-title-page { display: flex; align-items: center; justify-content: center; }
     .chapter-title-content { text-align: center; padding: 2em; }
@@ -236,16 +219,6 @@ def save_book_as_pdf(title: str, book_data: dict, filename: str) -> str:
         padding: 0;
     }
 
-    .main-content-body {
-        /* This resets the page counter to 1 right before the first chapter starts */
-        counter-reset: page 1;
-    }
-
-    /* This applies the 'main' page style (with numbers) to ALL pages inside the main-content-body */
-    .main-content-body .page {
-        page: main;
-    }
-
     /* This applies the 'main' page style ONLY to the epilogue */
     #epilogue.page {
         page: main;
@@ -270,12 +243,129 @@ def save_book_as_pdf(title: str, book_data: dict, filename: str) -> str:
         font-style: italic;
         font-size: 10pt;
     }
--
     """
-    
-    css = CSS(string=font_config + main_css)
-    # Ensure you have renamed your project folder to have a clean path
-    base_url = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-    HTML(string=rendered_html, base_url=base_url).write_pdf(output_path, stylesheets=[css])
-    
-    return output_path
\ No newline at end of file
+
+# Shared font configuration so WeasyPrint registers the Baskerville faces
+# once instead of on every export.
+_FONT_CONFIG = FontConfiguration()
+_COMPILED_CSS = CSS(string=_FONT_FACE_CSS + _MAIN_CSS, font_config=_FONT_CONFIG)
+
+
+# Cap on the SWAPI JSON dump shown on the debug pages. WeasyPrint's text
+# layout is O(lines), so an unbounded dump can dominate the render time.
+_DEBUG_JSON_MAX_CHARS = 50_000
+
+
+def render_chapter_html(chapter: dict, index: int) -> str:
+    """
+    Renders one chapter's HTML fragment. Exposed so callers can pre-render
+    chapters as they finish generating, overlapping this work with the
+    remaining chapters instead of doing it all inside save_book_as_pdf.
+    """
+    chapter = dict(chapter)
+    chapter["paragraphs"] = chapter.get("content", "").split("\n\n")
+    chapter.setdefault("has_image", bool(chapter.get("image_path")))
+    return _CHAPTER_TEMPLATE.render(chapter=chapter, index=index)
+
+
+def _render_book_html(title: str, book_data: dict, debug: bool = False,
+                      prerendered_chapter_html: list = None) -> bytes:
+    """Builds the template context and renders the full book HTML as UTF-8 bytes."""
+    # --- Prepare all data for the template ---
+    all_sections_for_toc = []
+    has_prologue = bool(book_data.get('prologue_text'))
+    has_epilogue = bool(book_data.get('epilogue_text'))
+    # Use preface_text directly in template context
+
+    # Correctly build the TOC including a check for the preface
+    if book_data.get('preface_text'):
+        all_sections_for_toc.append({"title": "Preface", "href": "#preface"})
+    if has_prologue:
+        all_sections_for_toc.append({"title": "Prologue", "href": "#prologue"})
+    for i, ch in enumerate(book_data.get("chapters", [])):
+        all_sections_for_toc.append({"title": ch["heading"], "href": f"#chapter-{i+1}"})
+    if has_epilogue:
+        all_sections_for_toc.append({"title": "Epilogue", "href": "#epilogue"})
+
+    template_context = {
+        "debug": debug,
+        "print_date": datetime.now().strftime("%B %d, %Y"),
+        "toc_entries": all_sections_for_toc,
+        "has_prologue": has_prologue,
+        "has_epilogue": has_epilogue,
+        **book_data,
+        # Last so the caller's cleaned title wins over the raw book_title
+        # key that book_data itself now carries.
+        "book_title": title,
+    }
+
+    # Split content into paragraphs once in Python so the template just
+    # iterates plain lists instead of calling str.split per block.
+    for key in ("preface", "prologue", "epilogue"):
+        text = template_context.get(f"{key}_text") or ""
+        template_context[f"{key}_paragraphs"] = text.split("\n\n")
+    for ch in template_context.get("chapters", []):
+        ch["paragraphs"] = ch.get("content", "").split("\n\n")
+        ch.setdefault("has_image", bool(ch.get("image_path")))
+
+    if debug:
+        json_output = template_context.get("swapi_json_output") or ""
+        if len(json_output) > _DEBUG_JSON_MAX_CHARS:
+            template_context["swapi_json_output"] = json_output[:_DEBUG_JSON_MAX_CHARS] + "\n... (truncated)"
+
+    parts = [_FRONT_TEMPLATE.render(template_context)]
+    for i, ch in enumerate(template_context.get("chapters", [])):
+        if prerendered_chapter_html is not None and i < len(prerendered_chapter_html) and prerendered_chapter_html[i]:
+            parts.append(prerendered_chapter_html[i])
+        else:
+            parts.append(_CHAPTER_TEMPLATE.render(chapter=ch, index=i + 1))
+    parts.append(_END_TEMPLATE.render(template_context))
+    # Hand WeasyPrint UTF-8 bytes directly so it doesn't re-encode the
+    # (potentially 100KB+) document a second time internally.
+    return "".join(parts).encode("utf-8")
+
+
+# Ensure you have renamed your project folder to have a clean path
+_BASE_URL = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def render_book_pdf(title: str, book_data: dict, debug: bool = False,
+                    prerendered_chapter_html: list = None) -> bytes:
+    """
+    Renders the book PDF fully in memory and returns the bytes, for callers
+    that stream the document to the client instead of serving it from disk.
+    """
+    rendered_html = _render_book_html(title, book_data, debug, prerendered_chapter_html)
+    buffer = io.BytesIO()
+    HTML(string=rendered_html, base_url=_BASE_URL, encoding="utf-8").write_pdf(
+        target=buffer, stylesheets=[_COMPILED_CSS], font_config=_FONT_CONFIG
+    )
+    return buffer.getvalue()
+
+
+def save_book_as_pdf(title: str, book_data: dict, filename: str, debug: bool = False,
+                     prerendered_chapter_html: list = None) -> str:
+    """
+    Generates the final, professionally formatted PDF with all structure requirements met.
+
+    When `debug` is true, the SWAPI call/JSON debug pages are included
+    (with the JSON dump truncated); by default they are skipped entirely.
+    """
+    output_dir = "generated_books"
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, filename)
+
+    rendered_html = _render_book_html(title, book_data, debug, prerendered_chapter_html)
+    # Write through an explicit file handle so the PDF streams to disk
+    # rather than coming back as one big bytes object. The render goes to a
+    # .part file and is moved into place atomically, so the final path only
+    # ever holds a complete PDF (/status and the static mount probe it while
+    # WeasyPrint is still writing).
+    partial_path = output_path + ".part"
+    with open(partial_path, "wb") as pdf_file:
+        HTML(string=rendered_html, base_url=_BASE_URL, encoding="utf-8").write_pdf(
+            target=pdf_file, stylesheets=[_COMPILED_CSS], font_config=_FONT_CONFIG
+        )
+    os.replace(partial_path, output_path)
+
+    return output_path
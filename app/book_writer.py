@@ -1,39 +1,120 @@
 from openai import AsyncOpenAI
 import os
 import asyncio
+import functools
+import hashlib
 import re
 import json
+import pickle
 import random
 import string
+import diskcache
 import httpx
+import orjson
+try:
+    import aiofiles
+except ImportError:
+    aiofiles = None
 from app.prompt_builder import (
     build_chapter_section_prompt, build_summarization_prompt,
     build_title_generation_prompt, build_data_selection_prompt,
-    build_safe_image_prompt_generation_prompt # Use the new safe prompt
+    build_book_plan_prompt,
+    build_safe_image_prompt_generation_prompt, # Use the new safe prompt
+    build_batch_safe_image_prompt
 )
 from dotenv import load_dotenv
 
 load_dotenv()
 
 openai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# One shared HTTP client for all image downloads so keep-alive and HTTP/2
+# multiplexing amortize the TLS handshake across chapters.
+_HTTPX = httpx.AsyncClient(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+)
+
 MODEL_TEXT = "gpt-4-1106-preview"
 MODEL_IMAGE = "dall-e-3"
 WORDS_PER_SECTION_TARGET = 750
+# The model can emit ~3000 words in one 4096-token completion, so chapters
+# up to this size go out as a single call instead of a rolling chain.
+WORDS_PER_CALL_LIMIT = 3000
 
-def load_all_swapi_data():
-    data = {}
+# Chapter titles come back as a numbered list; compiled once at import.
+_TITLE_RE = re.compile(r'^\s*\d+[.)]\s*(.+?)\s*$', re.MULTILINE)
+
+# Global bound on in-flight chat completions so concurrent chapters, image
+# prompts, and summaries share one rate-limit budget. Size it to the
+# account's rate tier via LLM_CONCURRENCY (e.g. ~8 long calls for 500 RPM).
+_LLM_SEMAPHORE = asyncio.Semaphore(int(os.getenv("LLM_CONCURRENCY", "8")))
+
+# DALL-E calls get their own (smaller) bound: image generation has a separate,
+# tighter rate limit than chat completions.
+_IMAGE_SEMAPHORE = asyncio.Semaphore(int(os.getenv("IMAGE_CONCURRENCY", "4")))
+
+async def _chat_completion(**kwargs):
+    """Issues a chat completion under the shared rate-limit semaphore."""
+    async with _LLM_SEMAPHORE:
+        return await openai.chat.completions.create(**kwargs)
+
+# Disk-backed memoization for the cheaper OpenAI helpers. Repeat runs with
+# the same inputs (debugging, PDF re-exports) skip the 1-3s API round trip.
+_OPENAI_CACHE = diskcache.Cache("cache/openai")
+
+def _disk_cached(fn):
+    """Caches an async helper's result on disk, keyed by function + inputs."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        key_source = json.dumps(
+            {"fn": fn.__name__, "model": MODEL_TEXT, "args": args, "kwargs": kwargs},
+            sort_keys=True, default=str,
+        )
+        key = hashlib.sha256(key_source.encode()).hexdigest()
+        cached = _OPENAI_CACHE.get(key)
+        if cached is not None:
+            return cached
+        result = await fn(*args, **kwargs)
+        if result is not None:
+            _OPENAI_CACHE.set(key, result)
+        return result
+    return wrapper
+
+@functools.lru_cache(maxsize=1)
+def get_all_swapi_data():
+    """Loads the SWAPI dataset on first use and caches it for the process."""
     data_dir = "swapi_data"
     if not os.path.exists(data_dir):
         raise FileNotFoundError("The 'swapi_data' directory was not found. Please run the fetch_swapi_data.py script first.")
-    for filename in os.listdir(data_dir):
-        if filename.endswith(".json"):
-            category = filename.replace(".json", "")
-            with open(os.path.join(data_dir, filename), "r", encoding='utf-8') as f:
-                data[category] = json.load(f)
+
+    # Load the pickled blob when it is up to date: unpickling one file is
+    # much faster than re-parsing six JSON files on every import.
+    pickle_path = os.path.join(data_dir, "all.pkl")
+    json_paths = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.endswith(".json")]
+    if os.path.exists(pickle_path) and all(os.path.getmtime(p) <= os.path.getmtime(pickle_path) for p in json_paths):
+        with open(pickle_path, "rb") as f:
+            return pickle.load(f)
+
+    data = {}
+    for path in json_paths:
+        category = os.path.basename(path).replace(".json", "")
+        with open(path, "rb") as f:
+            data[category] = orjson.loads(f.read())
+    with open(pickle_path, "wb") as f:
+        pickle.dump(data, f)
     return data
 
-ALL_SWAPI_DATA = load_all_swapi_data()
-print("SWAPI data loaded successfully.")
+@functools.lru_cache(maxsize=1)
+def _get_name_index():
+    """Index items by (category, name-or-title) so selected names resolve in
+    O(1) instead of re-scanning each category list."""
+    return {
+        (category, item.get('name') or item.get('title')): item
+        for category, items in get_all_swapi_data().items()
+        for item in items
+    }
 
 # NEW: Robust calculation function to determine chapter count and word length
 def calculate_book_parameters(num_pages: int) -> tuple[int, int]:
@@ -55,50 +136,42 @@ def calculate_book_parameters(num_pages: int) -> tuple[int, int]:
 
 
 async def select_book_data_context(prompt: str) -> dict:
-    selection_prompt = build_data_selection_prompt(prompt, ALL_SWAPI_DATA)
-    response = await openai.chat.completions.create(
+    all_swapi_data = get_all_swapi_data()
+    selection_prompt = build_data_selection_prompt(prompt, all_swapi_data)
+    response = await _chat_completion(
         model=MODEL_TEXT, messages=[{"role": "user", "content": selection_prompt}],
         temperature=0.3, response_format={"type": "json_object"}
     )
     try:
         selected_names = json.loads(response.choices[0].message.content)
+        name_index = _get_name_index()
         book_context = {}
         for category, names in selected_names.items():
-            if category in ALL_SWAPI_DATA:
-                book_context[category] = [item for item in ALL_SWAPI_DATA[category] if item.get('name') in names or item.get('title') in names]
+            if category in all_swapi_data:
+                book_context[category] = [name_index[(category, n)] for n in names if (category, n) in name_index]
         return book_context
     except (json.JSONDecodeError, KeyError):
         return { "people": [], "planets": [], "starships": [] }
 
-async def generate_chapter_image(chapter_summary: str) -> str:
-    """
-    Generates a chapter image using a safer, two-step process to avoid content policy errors.
-    """
-    print(f"  - Generating image for chapter based on summary: '{chapter_summary[:80]}...'")
-    safe_prompt_request = build_safe_image_prompt_generation_prompt(chapter_summary)
-    try:
-        sanitized_prompt_response = await openai.chat.completions.create(model=MODEL_TEXT, messages=[{"role": "user", "content": safe_prompt_request}], temperature=0.7, max_tokens=300)
-        image_prompt = sanitized_prompt_response.choices[0].message.content.strip().strip('"')
-        print(f"    - Sanitized DALL-E Prompt: {image_prompt}")
-        response = await openai.images.generate(model=MODEL_IMAGE, prompt=image_prompt, size="1024x1024", quality="standard", n=1)
-        image_url = response.data[0].url
-        output_dir = "generated_images"
-        os.makedirs(output_dir, exist_ok=True)
-        image_filename = f"{''.join(random.choices(string.ascii_letters + string.digits, k=12))}.png"
-        output_path = os.path.join(output_dir, image_filename)
-        async with httpx.AsyncClient() as client:
-            image_response = await client.get(image_url)
-            image_response.raise_for_status()
-            with open(output_path, "wb") as f: f.write(image_response.content)
-        print(f"  - Chapter image saved to: {output_path}")
-        return output_path
-    except Exception as e:
-        print(f"  - Could not generate chapter image: {e}")
-        return None
+async def _download_image(image_url: str, output_path: str) -> None:
+    """Streams an image to disk in chunks instead of buffering the whole PNG."""
+    async with _HTTPX.stream("GET", image_url) as response:
+        response.raise_for_status()
+        if aiofiles is not None:
+            async with aiofiles.open(output_path, "wb") as f:
+                async for chunk in response.aiter_bytes(65536):
+                    await f.write(chunk)
+        else:
+            with open(output_path, "wb") as f:
+                async for chunk in response.aiter_bytes(65536):
+                    f.write(chunk)
 
+# The title helpers are deliberately not disk-cached: they run at high
+# temperature, and freezing their creative output would hand every repeat
+# of a prompt the same title (see also generate_book_plan).
 async def generate_book_title(prompt: str) -> str:
     title_prompt = build_title_generation_prompt(prompt, "book")
-    response = await openai.chat.completions.create(
+    response = await _chat_completion(
         model=MODEL_TEXT, messages=[{"role": "user", "content": title_prompt}],
         temperature=0.8, max_tokens=20
     )
@@ -106,35 +179,42 @@ async def generate_book_title(prompt: str) -> str:
 
 async def generate_chapter_titles(prompt: str, data_context: dict, num_chapters: int) -> list[str]:
     titles_prompt = build_title_generation_prompt(prompt, "chapter_list", data_context, num_chapters)
-    response = await openai.chat.completions.create(
+    response = await _chat_completion(
         model=MODEL_TEXT, messages=[{"role": "user", "content": titles_prompt}],
         temperature=0.7, max_tokens=60 * num_chapters
     )
     content = response.choices[0].message.content
-    titles = re.findall(r'^\d+\.\s*(.*)', content, re.MULTILINE)
+    titles = _TITLE_RE.findall(content)
     return titles if titles else [f"Chapter {i+1}" for i in range(num_chapters)]
 
-async def generate_chapter_section(prompt: str, title: str, summary: str, context: dict, words: int) -> str:
+async def generate_chapter_section(prompt: str, title: str, summary: str, context_json: str, words: int, max_tokens: int = 1200) -> str:
     # This now correctly uses the requested word count
-    content_prompt = build_chapter_section_prompt(prompt, title, summary, context, words)
-    response = await openai.chat.completions.create(
+    content_prompt = build_chapter_section_prompt(prompt, title, summary, context_json, words)
+    response = await _chat_completion(
         model=MODEL_TEXT, messages=[{"role": "user", "content": content_prompt}],
-        temperature=0.75, max_tokens=1200
+        temperature=0.75, max_tokens=max_tokens
     )
     return response.choices[0].message.content.strip()
 
-async def summarize_section(text: str) -> str:
+@_disk_cached
+async def _summarize_section(text: str) -> str:
     summary_prompt = build_summarization_prompt(text)
+    response = await _chat_completion(
+        model=MODEL_TEXT, messages=[{"role": "user", "content": summary_prompt}],
+        temperature=0.2, max_tokens=200
+    )
+    return response.choices[0].message.content.strip()
+
+async def summarize_section(text: str) -> str:
+    # The fallback lives outside the cached helper so a transient API
+    # failure degrades this one call instead of being written to disk and
+    # served forever; the next call retries the API.
     try:
-        response = await openai.chat.completions.create(
-            model=MODEL_TEXT, messages=[{"role": "user", "content": summary_prompt}],
-            temperature=0.2, max_tokens=200
-        )
-        return response.choices[0].message.content.strip()
+        return await _summarize_section(text)
     except Exception:
         return text[:300] + "..."
 
-async def generate_content_block(prompt: str, title: str, context: dict, word_target: int) -> str:
+async def generate_content_block(prompt: str, title: str, context_json: str, word_target: int) -> str:
     print(f"--- Generating content for: '{title}' (Target: {word_target} words) ---")
     if word_target <= 0:
         return ""
@@ -142,15 +222,24 @@ async def generate_content_block(prompt: str, title: str, context: dict, word_ta
     # If the target is small (like for a prologue), do it in one go.
     if word_target <= WORDS_PER_SECTION_TARGET:
         print(f"  - Generating single section of {word_target} words...")
-        return await generate_chapter_section(prompt, title, "Start of the section.", context, word_target)
+        return await generate_chapter_section(prompt, title, "Start of the section.", context_json, word_target)
 
-    # Otherwise, use the multi-part logic for long chapters
+    # Typical chapters fit in a single completion, which saves the
+    # generate->summarize round trips of the rolling chain entirely.
+    if word_target <= WORDS_PER_CALL_LIMIT:
+        print(f"  - Generating full {word_target}-word block in one completion...")
+        return await generate_chapter_section(
+            prompt, title, "Start of the section.", context_json, word_target,
+            max_tokens=min(4096, int(word_target * 1.5))
+        )
+
+    # Otherwise, use the multi-part logic for very long chapters
     num_sections = round(word_target / WORDS_PER_SECTION_TARGET)
     parts = []
     summary = f"The section is '{title}'. Set the scene and begin the narrative."
     for i in range(num_sections):
         print(f"  - Generating part {i+1}/{num_sections}...")
-        section_text = await generate_chapter_section(prompt, title, summary, context, WORDS_PER_SECTION_TARGET)
+        section_text = await generate_chapter_section(prompt, title, summary, context_json, WORDS_PER_SECTION_TARGET)
         parts.append(section_text)
         if i < num_sections - 1:
             print(f"  - Summarizing part {i+1} for continuity...")
@@ -160,98 +249,190 @@ async def generate_content_block(prompt: str, title: str, context: dict, word_ta
     print(f"--- Finished content for: '{title}' ---")
     return "\n\n".join(parts)
 
-async def generate_user_prompt_driven_book(prompt: str, num_pages: int):
-    chapters_needed, target_words_per_chapter = calculate_book_parameters(num_pages)
-    
-    print("Selecting relevant SWAPI data based on prompt...")
-    data_context = await select_book_data_context(prompt)
-    
-    print("Generating front matter and chapter outline...")
-    prologue_word_target = 250
-    epilogue_word_target = 250
-    
-    tasks = {
-        "prologue": generate_content_block(prompt, "Prologue", data_context, prologue_word_target),
-        "epilogue": generate_content_block(prompt, "Epilogue", data_context, epilogue_word_target),
-        "titles": generate_chapter_titles(prompt, data_context, chapters_needed)
+async def generate_book_plan(prompt: str, num_chapters: int,
+                             prologue_words: int = 250, epilogue_words: int = 250) -> dict:
+    """Generates the cast selection, title, chapter titles, prologue, and
+    epilogue in one batched JSON completion instead of separate round trips.
+
+    Deliberately not disk-cached: the chapters are regenerated fresh each
+    run, so freezing this high-temperature plan would pin a stale title,
+    prologue, and epilogue to a story they no longer match.
+    """
+    plan_prompt = build_book_plan_prompt(prompt, get_all_swapi_data(), num_chapters, prologue_words, epilogue_words)
+    response = await _chat_completion(
+        model=MODEL_TEXT, messages=[{"role": "user", "content": plan_prompt}],
+        temperature=0.75, response_format={"type": "json_object"}
+    )
+    try:
+        plan = json.loads(response.choices[0].message.content)
+    except json.JSONDecodeError:
+        plan = {}
+
+    # Resolve the selected names back to full SWAPI records via the index.
+    name_index = _get_name_index()
+    data_context = {}
+    for category in ("people", "planets", "starships"):
+        names = plan.get(category) or []
+        data_context[category] = [name_index[(category, n)] for n in names if (category, n) in name_index]
+
+    return {
+        "book_title": (plan.get("book_title") or "A Star Wars Story").strip(),
+        "data_context": data_context,
+        "chapter_titles": plan.get("chapter_titles") or [f"Chapter {i+1}" for i in range(num_chapters)],
+        "prologue": plan.get("prologue") or "",
+        "epilogue": plan.get("epilogue") or "",
     }
-    results = await asyncio.gather(*tasks.values())
-    prologue_text, epilogue_text, chapter_titles = results
-    final_titles = chapter_titles[:chapters_needed]
-    
-    chapters_data = []
-    print("\n--- Starting Sequential Chapter and Image Generation ---")
-    for i, title in enumerate(final_titles):
-        chapter_heading = f"Chapter {i+1}: {title}"
-        print(f"\n[Generating Content for {chapter_heading}]")
-        
-        chapter_text = await generate_content_block(prompt, chapter_heading, data_context, target_words_per_chapter)
-        image_summary = await summarize_section(chapter_text)
-        image_path = await generate_chapter_image(image_summary)
-        
-        chapters_data.append({"heading": title, "content": chapter_text, "image_path": image_path})
-        await asyncio.sleep(4)
+
+async def generate_user_prompt_driven_book(prompt: str, num_pages: int, chapter_sink=None):
+    chapters_needed, target_words_per_chapter = calculate_book_parameters(num_pages)
+
+    print("Planning book: cast selection, title, outline, and front matter...")
+    plan = await generate_book_plan(prompt, chapters_needed)
+    book_title = plan["book_title"]
+    data_context = plan["data_context"]
+    prologue_text = plan["prologue"]
+    epilogue_text = plan["epilogue"]
+    final_titles = plan["chapter_titles"][:chapters_needed]
+    # Serialize the context once per book; every section prompt and the
+    # debug page reuse this same string.
+    data_context_json = orjson.dumps(data_context, option=orjson.OPT_INDENT_2).decode()
+
+    print("\n--- Starting Pipelined Chapter and Image Generation ---")
+    # Chapters are independent of each other (the rolling summary only lives
+    # inside a chapter), so generate them concurrently. The semaphore keeps
+    # us under the OpenAI rate limit instead of the old sleep(4) pacing.
+    chapter_semaphore = asyncio.Semaphore(4)
+    image_summaries: dict[int, str] = {}
+
+    async def _make_chapter_text(i: int, title: str) -> dict:
+        async with chapter_semaphore:
+            chapter_heading = f"Chapter {i+1}: {title}"
+            print(f"\n[Generating Content for {chapter_heading}]")
+            chapter_text = await generate_content_block(prompt, chapter_heading, data_context_json, target_words_per_chapter)
+            image_summaries[i] = await summarize_section(chapter_text)
+        return {"heading": title, "content": chapter_text}
+
+    chapters_data = await asyncio.gather(*[_make_chapter_text(i, title) for i, title in enumerate(final_titles)])
+
+    # One batched completion sanitizes every chapter summary into a safe
+    # DALL-E prompt, replacing a chat round trip per chapter; the image
+    # generations themselves then all run concurrently.
+    safe_prompts = await generate_safe_image_prompts([image_summaries[i] for i in range(len(chapters_data))])
+
+    async def _finish_chapter(i: int, chapter: dict, safe_prompt: str) -> None:
+        if safe_prompt:
+            chapter["image_path"] = await _generate_image_from_prompt(safe_prompt)
+        else:
+            # The batch came back malformed for this slot - fall back to the
+            # per-chapter sanitize-then-generate path.
+            chapter["image_path"] = await generate_chapter_image(image_summaries[i])
+        # Normalize the possibly-None image path into a plain flag so
+        # the template never truthy-tests (or stringifies) a None.
+        chapter["has_image"] = bool(chapter["image_path"])
+        if chapter_sink is not None:
+            # Hand the finished chapter to the caller right away so
+            # downstream work (e.g. pre-rendering its HTML) overlaps
+            # with the images still being generated.
+            await chapter_sink(i, chapter)
+
+    await asyncio.gather(*[
+        _finish_chapter(i, chapter, safe_prompt)
+        for (i, chapter), safe_prompt in zip(enumerate(chapters_data), safe_prompts)
+    ])
 
     preface_text = """A long time ago, in a galaxy far, far away, the stories were endless. They were tales of heroism and betrayal, of light and darkness, echoing from the Core Worlds to the Outer Rim. What you hold in your hands is one such echo—a story inspired by a fragment of that vast history.
 
 This is a work of fan-fiction, a tribute to the universe that has captured our imaginations for generations. It is a 'what if,' a new perspective on a familiar galaxy. It was not crafted by a story group or a corporation, but by a spark of digital consciousness guided by a simple prompt, weaving together known legends with new possibilities. May it transport you, once again, to that galaxy of endless adventure."""
 
     return {
+        "book_title": book_title,
         "swapi_call_text": f"User Prompt: {prompt}",
-        "swapi_json_output": json.dumps(data_context, indent=4),
+        "swapi_json_output": data_context_json,
         "preface_text": preface_text,
         "prologue_text": prologue_text,
         "epilogue_text": epilogue_text,
         "chapters": chapters_data,
     }
 
-async def generate_chapter_image(chapter_summary: str) -> str:
+async def generate_safe_image_prompts(summaries: list[str]) -> list[str]:
     """
-    Generates a chapter image using a safer, two-step process to avoid content policy errors.
+    Generates safe DALL-E prompts for every chapter summary in one batched
+    completion instead of a sanitizing round trip per chapter.
+
+    Returns one prompt per summary, in order; a slot is None when the batch
+    response was unusable (the caller falls back to the per-chapter path).
     """
-    print(f"  - Generating image for chapter based on summary: '{chapter_summary[:80]}...'")
-    
-    # Step 1: Ask the LLM to generate a safe, descriptive prompt for DALL-E.
-    print("    - Creating a safe and descriptive prompt for DALL-E...")
-    safe_prompt_request = build_safe_image_prompt_generation_prompt(chapter_summary)
-    
+    if not summaries:
+        return []
+    print(f"  - Creating safe DALL-E prompts for {len(summaries)} chapters in one call...")
     try:
-        # Get the sanitized prompt from GPT-4
-        sanitized_prompt_response = await openai.chat.completions.create(
+        response = await _chat_completion(
             model=MODEL_TEXT,
-            messages=[{"role": "user", "content": safe_prompt_request}],
+            messages=[{"role": "user", "content": build_batch_safe_image_prompt(summaries)}],
             temperature=0.7,
-            max_tokens=250
+            response_format={"type": "json_object"}
         )
-        image_prompt = sanitized_prompt_response.choices[0].message.content.strip().strip('"')
-        print(f"    - Sanitized DALL-E Prompt: {image_prompt}")
+        prompts = orjson.loads(response.choices[0].message.content).get("prompts") or []
+    except Exception as e:
+        print(f"  - Batched prompt sanitizing failed: {e}")
+        prompts = []
+    if len(prompts) != len(summaries):
+        return [None] * len(summaries)
+    return [str(p).strip().strip('"') for p in prompts]
 
-        # Step 2: Generate the image using the new, safe prompt.
-        print("    - Sending sanitized prompt to DALL-E...")
-        response = await openai.images.generate(
-            model=MODEL_IMAGE,
-            prompt=image_prompt,
-            size="1024x1792",
-            quality="standard",
-            n=1
-        )
+async def _generate_image_from_prompt(image_prompt: str, size: str = "1024x1792") -> str:
+    """Runs a DALL-E generation for an already-sanitized prompt and streams
+    the result to disk. Returns the saved path, or None on failure."""
+    try:
+        async with _IMAGE_SEMAPHORE:
+            response = await openai.images.generate(
+                model=MODEL_IMAGE,
+                prompt=image_prompt,
+                size=size,
+                quality="standard",
+                n=1
+            )
         image_url = response.data[0].url
 
-        # Step 3: Download and save the image.
         output_dir = "generated_images"
         os.makedirs(output_dir, exist_ok=True)
         image_filename = f"{''.join(random.choices(string.ascii_letters + string.digits, k=12))}.png"
         output_path = os.path.join(output_dir, image_filename)
-        
-        async with httpx.AsyncClient() as client:
-            image_response = await client.get(image_url)
-            image_response.raise_for_status()
-            with open(output_path, "wb") as f:
-                f.write(image_response.content)
-                
+
+        await _download_image(image_url, output_path)
+
         print(f"  - Chapter image saved to: {output_path}")
         return output_path
 
     except Exception as e:
         print(f"  - Could not generate chapter image: {e}")
-        return None
\ No newline at end of file
+        return None
+
+async def generate_chapter_image(chapter_summary: str, size: str = "1024x1792") -> str:
+    """
+    Generates a chapter image using a safer, two-step process to avoid content policy errors.
+
+    Defaults to the portrait size so images fill the book's portrait pages.
+    """
+    print(f"  - Generating image for chapter based on summary: '{chapter_summary[:80]}...'")
+
+    # Step 1: Ask the LLM to generate a safe, descriptive prompt for DALL-E.
+    print("    - Creating a safe and descriptive prompt for DALL-E...")
+    safe_prompt_request = build_safe_image_prompt_generation_prompt(chapter_summary)
+
+    try:
+        # Get the sanitized prompt from GPT-4
+        sanitized_prompt_response = await _chat_completion(
+            model=MODEL_TEXT,
+            messages=[{"role": "user", "content": safe_prompt_request}],
+            temperature=0.7,
+            max_tokens=250
+        )
+        image_prompt = sanitized_prompt_response.choices[0].message.content.strip().strip('"')
+        print(f"    - Sanitized DALL-E Prompt: {image_prompt}")
+    except Exception as e:
+        print(f"  - Could not generate chapter image: {e}")
+        return None
+
+    # Step 2: Generate and download the image using the new, safe prompt.
+    return await _generate_image_from_prompt(image_prompt, size=size)
\ No newline at end of file
@@ -2,6 +2,7 @@
 import httpx
 import asyncio
 import json
+import math
 import os
 import warnings
 
@@ -11,37 +12,48 @@ warnings.filterwarnings("ignore", message="Unverified HTTPS request")
 SWAPI_BASE_URL = "https://swapi.dev/api"
 OUTPUT_DIR = "swapi_data"
 
+# Bound concurrency instead of sleeping between requests - still polite to
+# the API, but pages download in parallel rather than one at a time.
+_FETCH_SEMAPHORE = asyncio.Semaphore(8)
+
+
+async def _fetch_page(client: httpx.AsyncClient, url: str) -> dict:
+    """Fetches a single page, returning an empty page on request errors."""
+    async with _FETCH_SEMAPHORE:
+        try:
+            print(f"Fetching page: {url}")
+            response = await client.get(url)
+            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+            return response.json()
+        except httpx.RequestError as e:
+            print(f"An error occurred while requesting {e.request.url!r}: {e}")
+            return {"results": []}
+
 
 async def fetch_all_for_category(client: httpx.AsyncClient, category: str) -> list:
     """
-    Fetches all data for a given category (e.g., 'people', 'planets')
-    by following the pagination links.
+    Fetches all data for a given category (e.g., 'people', 'planets').
+
+    The first page reports the total count, so the remaining page URLs are
+    known up front and can be fetched concurrently instead of walking the
+    'next' links serially.
     """
-    all_results = []
-    next_url = f"{SWAPI_BASE_URL}/{category}/"
     print(f"--- Starting fetch for category: {category} ---")
+    first_page = await _fetch_page(client, f"{SWAPI_BASE_URL}/{category}/?page=1")
 
-    while next_url:
-        try:
-            print(f"Fetching page: {next_url}")
-            response = await client.get(next_url)
-            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            
-            data = response.json()
-            
-            # Add the results from the current page to our master list
-            all_results.extend(data.get("results", []))
-            
-            # Get the URL for the next page, or None if it's the last page
-            next_url = data.get("next")
-            
-            # Be a good API citizen and wait a tiny bit between requests
-            await asyncio.sleep(0.1) 
+    all_results = list(first_page.get("results", []))
+    count = first_page.get("count", 0)
+    page_size = len(all_results)
+
+    if page_size and count > page_size:
+        total_pages = math.ceil(count / page_size)
+        remaining = await asyncio.gather(*[
+            _fetch_page(client, f"{SWAPI_BASE_URL}/{category}/?page={page}")
+            for page in range(2, total_pages + 1)
+        ])
+        for page_data in remaining:
+            all_results.extend(page_data.get("results", []))
 
-        except httpx.RequestError as e:
-            print(f"An error occurred while requesting {e.request.url!r}: {e}")
-            break # Stop trying on an error
-            
     print(f"--- Finished fetch for {category}. Found {len(all_results)} items. ---\n")
     return all_results
 
@@ -51,7 +63,7 @@ async def main():
     """
     # Create the output directory if it doesn't exist
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    
+
     # List of categories you want to download
     categories_to_fetch = [
         "people",
@@ -61,21 +73,24 @@ async def main():
         "species",
         "films"
     ]
-    
+
     # Use an async client to make efficient requests
     async with httpx.AsyncClient(verify=False, timeout=20.0) as client:
-        for category in categories_to_fetch:
-            # Fetch all data for the current category
-            category_data = await fetch_all_for_category(client, category)
-            
+        # All categories download concurrently; the shared semaphore keeps
+        # the total number of in-flight requests bounded.
+        results = await asyncio.gather(*[
+            fetch_all_for_category(client, category) for category in categories_to_fetch
+        ])
+
+        for category, category_data in zip(categories_to_fetch, results):
             if category_data:
                 # Define the output file path
                 file_path = os.path.join(OUTPUT_DIR, f"{category}.json")
-                
+
                 # Write the collected data to a JSON file
                 with open(file_path, "w", encoding="utf-8") as f:
                     json.dump(category_data, f, ensure_ascii=False, indent=4)
                 print(f"Successfully saved data to {file_path}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -1,93 +1,217 @@
 # app/main.py
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from app.book_writer import generate_user_prompt_driven_book, generate_book_title
-from app.book_pdf_exporter import save_book_as_pdf
+from app.book_writer import generate_user_prompt_driven_book, get_all_swapi_data
+from app.book_pdf_exporter import save_book_as_pdf, render_book_pdf, render_chapter_html
+from app.swapi_client import close_client
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+import logging
 import os
-import re
-import traceback
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
 load_dotenv()
 
+# Log records are enqueued on the request path and written by a background
+# thread, so formatting and stream I/O never block the event loop.
+_log_queue: queue.Queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+
+logger = logging.getLogger("starwars_book_gen")
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(_log_queue))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup side effects live here instead of at import time, so merely
+    # importing the module stays cheap (tests, tooling, workers forking).
+    # The paths used here will be the root of your project on Render.
+    os.makedirs("generated_books", exist_ok=True)
+    os.makedirs("ui_images", exist_ok=True)
+    os.makedirs("videos", exist_ok=True)
+    # Prime the SWAPI dataset so the first request doesn't pay the load.
+    get_all_swapi_data()
+    yield
+    # Close the shared SWAPI connection pool cleanly and flush pending logs.
+    await close_client()
+    _log_listener.stop()
+
 app = FastAPI(
     title="Star Wars Book Generator",
     description="An API to generate a personalized Star Wars fan novel based on a user prompt.",
-    version="4.0.0"
+    version="4.0.0",
+    lifespan=lifespan,
+    # orjson serializes the JSON bodies (notably the prologue preview) far
+    # faster than the stdlib encoder behind the default JSONResponse.
+    default_response_class=ORJSONResponse
 )
 
-# --- NEW: Create directories on startup to prevent errors ---
-# This ensures the folders exist before FastAPI tries to mount them.
-# The path used here will be the root of your project on Render.
-os.makedirs("generated_books", exist_ok=True)
-os.makedirs("ui_images", exist_ok=True)
-os.makedirs("videos", exist_ok=True)
-# --- End of New Code ---
+# Compress text-heavy responses (JSON previews, index.html) on the wire.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
-# Serve the static folders
-app.mount("/generated_books", StaticFiles(directory="generated_books"), name="generated_books")
-app.mount("/ui_images", StaticFiles(directory="ui_images"), name="ui_images")
-app.mount("/videos", StaticFiles(directory="videos"), name="videos")
+# Serve the static folders (created in lifespan, hence check_dir=False)
+app.mount("/generated_books", StaticFiles(directory="generated_books", check_dir=False), name="generated_books")
+app.mount("/ui_images", StaticFiles(directory="ui_images", check_dir=False), name="ui_images")
+app.mount("/videos", StaticFiles(directory="videos", check_dir=False), name="videos")
 
 class BookRequest(BaseModel):
     user_input: str
     num_pages: int = 100
+    # When true, the PDF bytes come back in this response directly instead
+    # of a URL the client has to fetch in a second round trip.
+    stream_pdf: bool = False
+
+# Strips filesystem-unsafe characters; a translate table is a plain C loop,
+# cheaper than spinning up the regex engine per request.
+_SANITIZE_TABLE = str.maketrans("", "", '\\/*?:"<>|')
 
 def sanitize_filename(text: str) -> str:
-    sanitized = re.sub(r'[\\/*?:"<>|]', "", text)
-    return sanitized[:50].strip().replace(' ', '_')
+    return text.translate(_SANITIZE_TABLE)[:50].strip().replace(' ', '_')
 
-@app.get("/", response_class=HTMLResponse)
+@app.get("/", response_class=FileResponse)
 async def read_root():
-    with open("index.html") as f:
-        return HTMLResponse(content=f.read(), status_code=200)
+    # FileResponse serves straight from the filesystem (sendfile on Linux)
+    # with caching headers, instead of re-reading the file per request.
+    return FileResponse("index.html", media_type="text/html")
+
+def _failure_marker_path(filename: str) -> str:
+    return os.path.join("generated_books", filename + ".failed")
+
+def _clear_failure_marker(filename: str) -> None:
+    try:
+        os.remove(_failure_marker_path(filename))
+    except FileNotFoundError:
+        pass
+
+def _render_pdf_background(title: str, book_data: dict, filename: str,
+                           prerendered_chapter_html: list = None) -> None:
+    # Runs after the response has gone out, so an exception here has no
+    # request to fail - record it in a marker file that /status reports.
+    try:
+        save_book_as_pdf(
+            title=title,
+            book_data=book_data,
+            filename=filename,
+            prerendered_chapter_html=prerendered_chapter_html
+        )
+    except Exception as e:
+        logger.exception("Background PDF render failed for %s: %s", filename, e)
+        with open(_failure_marker_path(filename), "w") as f:
+            f.write(str(e))
+
+def _write_pdf_to_disk(pdf_bytes: bytes, filename: str) -> None:
+    os.makedirs("generated_books", exist_ok=True)
+    # Write to a .part file and move it into place atomically so /status
+    # and the static mount never see a half-written PDF.
+    output_path = os.path.join("generated_books", filename)
+    with open(output_path + ".part", "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(output_path + ".part", output_path)
 
 @app.post("/generate-book/", summary="Generate a Star Wars Book")
-async def generate_star_wars_book(request: BookRequest):
-    # This function remains the same, no changes needed here
+async def generate_star_wars_book(request: BookRequest, background_tasks: BackgroundTasks):
     user_prompt = request.user_input.strip()
     if not user_prompt:
         raise HTTPException(status_code=400, detail="Prompt cannot be empty.")
     
     final_page_count = min(request.num_pages, 100)
-    print(f"Processing request for a {final_page_count}-page book.")
+    logger.info("Processing request for a %d-page book.", final_page_count)
 
     try:
-        print("Generating a unique book title...")
-        raw_title = await generate_book_title(user_prompt)
-        book_title = raw_title.replace("#", "").strip()
-        print(f"Generated Title: {book_title}")
+        logger.info("Generating book components for prompt: '%s'...", user_prompt)
+
+        # Chapters hand their HTML off for rendering as soon as they finish,
+        # so template work overlaps with the chapters still being written.
+        chapter_html: dict[int, str] = {}
+
+        async def _prerender_chapter(i: int, chapter: dict):
+            chapter_html[i] = await run_in_threadpool(render_chapter_html, chapter, i + 1)
 
-        print(f"Generating book components for prompt: '{user_prompt}'...")
         book_data = await generate_user_prompt_driven_book(
             prompt=user_prompt,
-            num_pages=final_page_count
+            num_pages=final_page_count,
+            chapter_sink=_prerender_chapter
         )
-        print("Book components generated successfully.")
+        # The title now comes out of the same batched completion as the
+        # chapter outline, prologue, and epilogue.
+        book_title = book_data["book_title"].replace("#", "").strip()
+        logger.info("Generated Title: %s", book_title)
+        logger.info("Book components generated successfully.")
 
         filename = f"{sanitize_filename(book_title)}.pdf"
-        print(f"Generating PDF: {filename}...")
-        
-        output_pdf_path = await run_in_threadpool(
-            save_book_as_pdf,
+        logger.info("Queuing PDF render: %s...", filename)
+        prerendered = [chapter_html.get(i) for i in range(len(book_data.get("chapters", [])))]
+
+        if request.stream_pdf:
+            # Render in memory and ship the bytes straight back - the disk
+            # copy (for the /generated_books URL) happens after the response.
+            pdf_bytes = await run_in_threadpool(
+                render_book_pdf,
+                title=book_title,
+                book_data=book_data,
+                prerendered_chapter_html=prerendered
+            )
+            background_tasks.add_task(_write_pdf_to_disk, pdf_bytes, filename)
+            return Response(
+                content=pdf_bytes,
+                media_type="application/pdf",
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            )
+
+        # Respond as soon as the LLM phase is done and render the PDF after
+        # the response goes out (BackgroundTasks runs the sync renderer in a
+        # threadpool). Clients poll /status/{filename} until the file exists.
+        # Clear any stale failure marker before queuing so a poll can't pick
+        # up the verdict of an earlier render under the same name.
+        _clear_failure_marker(filename)
+        background_tasks.add_task(
+            _render_pdf_background,
             title=book_title,
             book_data=book_data,
-            filename=filename
+            filename=filename,
+            prerendered_chapter_html=prerendered
         )
-        print(f"PDF saved to: {output_pdf_path}")
-        
+
         pdf_url = f"/generated_books/{filename}"
 
         return {
             "title": book_title,
             "prompt": user_prompt,
             "pdf_file": pdf_url,
+            "status": "rendering",
+            "status_url": f"/status/{filename}",
             "preview": book_data.get('prologue_text', '')[:1500] + "..."
         }
     except Exception as e:
-        print(f"An error occurred during book generation: {e}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
\ No newline at end of file
+        logger.exception("An error occurred during book generation: %s", e)
+        raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
+
+@app.get("/status/{filename}", summary="Check whether a generated PDF is ready")
+async def get_book_status(filename: str):
+    # basename() guards against path traversal in the user-supplied name.
+    filename = os.path.basename(filename)
+    if os.path.exists(os.path.join("generated_books", filename)):
+        return {"status": "ready", "pdf_file": f"/generated_books/{filename}"}
+    if os.path.exists(_failure_marker_path(filename)):
+        return {"status": "failed", "detail": "PDF rendering failed."}
+    return {"status": "rendering"}
+
+if __name__ == "__main__":
+    import uvicorn
+    # uvloop + httptools are the C-implemented event loop and HTTP parser;
+    # WEB_CONCURRENCY (Render's convention) controls the worker count.
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+        loop="uvloop",
+        http="httptools",
+        timeout_keep_alive=30,
+    )
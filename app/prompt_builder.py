@@ -1,19 +1,35 @@
 # app/prompt_builder.py
-import json
+import orjson
+
+def _dumps(obj) -> str:
+    """Serializes prompt context with orjson (2-space indent) - much faster
+    than stdlib json for the medium-sized dicts fed into prompts."""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+
+# The SWAPI dataset is loaded once and reused, so its serialized summary is
+# cached per object identity instead of being rebuilt on every request.
+_DATA_SUMMARY_CACHE: dict[int, str] = {}
+
+def _summarize_available_data(all_data: dict) -> str:
+    cached = _DATA_SUMMARY_CACHE.get(id(all_data))
+    if cached is None:
+        data_summary = {
+            "people": [p.get('name') for p in all_data.get('people', [])],
+            "planets": [p.get('name') for p in all_data.get('planets', [])],
+            "starships": [s.get('name') for s in all_data.get('starships', [])],
+            "films": [f.get('title') for f in all_data.get('films', [])],
+        }
+        cached = _dumps(data_summary)
+        _DATA_SUMMARY_CACHE[id(all_data)] = cached
+    return cached
 
 def build_data_selection_prompt(user_prompt: str, all_data: dict) -> str:
     """Builds a prompt to ask the AI to select relevant entities from the SWAPI data."""
-    data_summary = {
-        "people": [p.get('name') for p in all_data.get('people', [])],
-        "planets": [p.get('name') for p in all_data.get('planets', [])],
-        "starships": [s.get('name') for s in all_data.get('starships', [])],
-        "films": [f.get('title') for f in all_data.get('films', [])],
-    }
     return f"""
 Based on the user's story prompt, select a small, coherent set of entities from the provided JSON data. This will be the "cast" for the entire novel. Choose a few main characters, a primary setting (planet), and a few relevant starships.
 USER PROMPT: "{user_prompt}"
 AVAILABLE DATA:
-{json.dumps(data_summary, indent=2)}
+{_summarize_available_data(all_data)}
 Your task:
 Respond with a JSON object containing the *names* of the entities to use. The JSON object should have keys: "people", "planets", "starships".
 Example Response:
@@ -47,6 +63,35 @@ I am writing a {num_chapters}-chapter Star Wars fan novel about: '{user_prompt}'
 Please generate a list of {num_chapters} creative and sequential chapter titles for this story. Return them as a numbered list (e.g., '1. The Awakening', '2. A Fading Hope').
 """
 
+def build_book_plan_prompt(user_prompt: str, all_data: dict, num_chapters: int,
+                           prologue_words: int, epilogue_words: int) -> str:
+    """Builds a single prompt that yields the cast selection, title, chapter
+    titles, prologue, and epilogue in one JSON response, instead of separate
+    API calls for each."""
+    return f"""
+You are a novelist planning and opening a {num_chapters}-chapter Star Wars fan novel about: '{user_prompt}'.
+Write in the second person ("You feel...", "You see...").
+
+First select a small, coherent set of entities from the AVAILABLE DATA below. This will be the "cast" for the entire novel: a few main characters, a primary setting (planet), and a few relevant starships. Use *only* names that appear in the data.
+
+AVAILABLE DATA:
+{_summarize_available_data(all_data)}
+
+CRITICAL INSTRUCTION: Base the prologue and epilogue *exclusively* on the cast you selected. Do not invent new characters, planets, or major technologies.
+
+Your task:
+Respond with a single JSON object with exactly these keys:
+{{
+  "book_title": "A short, creative, evocative title (no 'Star Wars:' prefix)",
+  "people": ["names of the chosen characters"],
+  "planets": ["names of the chosen planets"],
+  "starships": ["names of the chosen starships"],
+  "chapter_titles": ["{num_chapters} creative, sequential chapter titles"],
+  "prologue": "An approximately {prologue_words}-word prologue that sets the scene",
+  "epilogue": "An approximately {epilogue_words}-word epilogue that closes the story"
+}}
+"""
+
 def build_chapter_image_prompt(chapter_summary: str) -> str:
     """Builds a descriptive prompt for DALL-E based on a chapter's summary."""
     return f"""
@@ -55,8 +100,12 @@ The scene should be based on this summary: "{chapter_summary}"
 The image should be gritty and epic, with realistic textures and dramatic lighting. Do NOT include any text, titles, or logos in the image.
 """
 
-def build_chapter_section_prompt(user_prompt: str, chapter_title: str, previous_section_summary: str, data_context: dict, word_target: int) -> str:
-    """Builds the main prompt for generating a single section of a chapter's content."""
+def build_chapter_section_prompt(user_prompt: str, chapter_title: str, previous_section_summary: str, data_context_json: str, word_target: int) -> str:
+    """Builds the main prompt for generating a single section of a chapter's content.
+
+    Takes the data context already serialized, since the same context is fed
+    into every section of a book and only needs serializing once.
+    """
     return f"""
 You are a novelist writing a Star Wars story in the second person ("You feel...", "You see...").
 Your task is to write a single, detailed section of the novel.
@@ -69,7 +118,7 @@ CONTINUITY: The previous part of the story concluded with the following events:
 
 DATA CONTEXT (Your only source of truth for names, places, and specs):
 ---
-{json.dumps(data_context, indent=2)}
+{data_context_json}
 ---
 
 Your task:
@@ -88,20 +137,22 @@ TEXT TO SUMMARIZE:
 ---
 """
 
+# Describe roles instead of using direct names to avoid safety filters.
+# Checked in one pass over the cast rather than a scan per character.
+_ROLE_MAP = {
+    "Yoda": "a diminutive, wise, green-skinned Jedi Master",
+    "Kenobi": "a noble Jedi Knight with a beard",
+    "Palpatine": "a menacing, shadowy Emperor",
+}
+
 def build_image_generation_prompt(user_prompt: str, data_context: dict) -> str:
     """
     Builds a more descriptive and safer prompt for the DALL-E 3 image generator.
     """
-    # Describe roles instead of using direct names to avoid safety filters
-    character_descriptions = []
     people = data_context.get('people', [])
-    if any("Yoda" in p.get('name', '') for p in people):
-        character_descriptions.append("a diminutive, wise, green-skinned Jedi Master")
-    if any("Kenobi" in p.get('name', '') for p in people):
-        character_descriptions.append("a noble Jedi Knight with a beard")
-    if any("Palpatine" in p.get('name', '') for p in people):
-        character_descriptions.append("a menacing, shadowy Emperor")
-    
+    names = " ".join(p.get('name', '') for p in people)
+    character_descriptions = [desc for key, desc in _ROLE_MAP.items() if key in names]
+
     # Generic descriptions if no specific characters are found
     if not character_descriptions and people:
          character_descriptions.append(f"{len(people)} robed figures")
@@ -138,4 +189,23 @@ Create a single-paragraph DALL-E prompt that captures the essence of this summar
 **Example of a good, safe output:**
 "A dramatic digital painting of a veteran clone trooper, his armor showing signs of battle, taking cover in a lush, alien swamp. The mood is one of tense solitude, with shafts of light breaking through the dense canopy above."
 Now, generate the safe and descriptive prompt.
+"""
+
+def build_batch_safe_image_prompt(summaries: list[str]) -> str:
+    """
+    Asks the LLM to generate safe DALL-E prompts for every chapter summary in
+    one response, instead of a sanitizing round trip per chapter.
+    """
+    numbered_summaries = "\n".join(f'{i + 1}. "{summary}"' for i, summary in enumerate(summaries))
+    return f"""
+Below are {len(summaries)} chapter summaries from a Star Wars fan novel. For EACH summary, write a single, descriptive paragraph to be used as a prompt for an AI image generator (like DALL-E 3).
+**CRITICAL INSTRUCTIONS:**
+- Every generated prompt MUST be safe and adhere to content policies.
+- Do NOT use specific, named characters (e.g., "Rex", "Obi-Wan"). Instead, describe their roles (e.g., "a veteran clone trooper in customized armor," "a noble Jedi Master").
+- Do NOT describe graphic violence or gore.
+- Focus on creating cinematic, atmospheric, and visually rich scenes.
+**Chapter Summaries:**
+{numbered_summaries}
+**Your Task:**
+Respond with a JSON object of the form {{"prompts": ["...", "..."]}} containing exactly {len(summaries)} prompts, one per summary, in the same order. Each prompt should be in the style of "A dramatic digital painting..." and safe for all audiences.
 """
\ No newline at end of file
@@ -1,3 +1,5 @@
+import asyncio
+import diskcache
 import httpx
 import warnings
 
@@ -6,14 +8,64 @@ warnings.filterwarnings("ignore", message="Unverified HTTPS request")
 
 SWAPI_BASE_URL = "https://swapi.dev/api"
 
+# One pooled client shared by all lookups, so repeated searches reuse
+# keep-alive connections instead of redoing DNS/TCP/TLS per call.
+_CLIENT = httpx.AsyncClient(
+    base_url=SWAPI_BASE_URL,
+    verify=False,  # Skip SSL verification here
+    http2=True,
+    timeout=10.0,
+    limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+)
+
+async def close_client() -> None:
+    """Closes the shared client; call this on application shutdown."""
+    await _CLIENT.aclose()
+
+# Bound the fan-out so a big cast doesn't hammer SWAPI all at once.
+_SEARCH_SEMAPHORE = asyncio.Semaphore(20)
+
+# SWAPI data is effectively immutable, so cache lookups per search term:
+# an in-process dict for the fast path, backed by a persistent diskcache
+# that keeps the warm data across restarts.
+_MEM: dict[str, dict] = {}
+_DISK_CACHE = diskcache.Cache("cache/swapi")
+
 async def fetch_character_info(name: str) -> dict:
-    async with httpx.AsyncClient(verify=False) as client:  # Skip SSL verification here
+    cache_key = name.lower().strip()
+    if cache_key in _MEM:
+        return _MEM[cache_key]
+    cached = _DISK_CACHE.get(cache_key)
+    if cached is not None:
+        _MEM[cache_key] = cached
+        return cached
+
+    # Retry transient failures with exponential backoff so one flaky SWAPI
+    # response doesn't invalidate the whole book-generation request.
+    for attempt in range(4):
         try:
-            response = await client.get(f"{SWAPI_BASE_URL}/people/", params={"search": name})
+            response = await _CLIENT.get("/people/", params={"search": name})
             response.raise_for_status()
             results = response.json().get("results", [])
             if not results:
                 return {"name": name, "info": "No data found."}
-            return results[0]  # Return the first matched result
-        except httpx.RequestError as e:
-            return {"error": str(e)}
\ No newline at end of file
+            info = results[0]  # Return the first matched result
+            _MEM[cache_key] = info
+            _DISK_CACHE.set(cache_key, info)
+            return info
+        except (httpx.RequestError, httpx.HTTPStatusError) as e:
+            if attempt == 3:
+                return {"error": str(e)}
+            await asyncio.sleep(0.2 * 2 ** attempt)
+
+async def fetch_characters(names: list[str]) -> list[dict]:
+    """Looks up many characters concurrently instead of one await at a time."""
+    async def _bounded_fetch(name: str) -> dict:
+        async with _SEARCH_SEMAPHORE:
+            return await fetch_character_info(name)
+
+    results = await asyncio.gather(*[_bounded_fetch(name) for name in names], return_exceptions=True)
+    return [
+        result if not isinstance(result, BaseException) else {"error": str(result)}
+        for result in results
+    ]
\ No newline at end of file